@@ -1,15 +1,43 @@
+import argparse
 import colorsys
-import xml.etree.cElementTree as ET
+import hashlib
+import inspect
+import io
+import json
+try:
+    import xml.etree.cElementTree as ET
+except ImportError:
+    # cElementTree is gone since Python 3.9
+    import xml.etree.ElementTree as ET
+import multiprocessing
+import multiprocessing.connection
+import pickle
 import plistlib
 import os.path
 import sys
 import re
+import tempfile
+import time
+import zipfile
+from xml.parsers import expat
 
 default_attributes = {}
+# scheme name -> (colors, attributes) as defined in the bundled schemes, used by the minimal output mode
+parent_schemes = {}
+# scope resolutions of rule sets converted by this process, see resolve_scopes()
+scope_resolutions = {}
 all_attributes = []
 all_colors = {}
 IGNORE_COLOR = (None, None, None)
 IGNORE_COLOR_VALUE = "#IGNORE_COLOR"
+# bump when the layout of normalized settings changes, so stale cache entries are not picked up
+SETTINGS_CACHE_VERSION = 2
+# bundled IDEA schemes, default values of attributes and parents of the converted schemes
+DEFAULT_SCHEMES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'DefaultColorSchemesManager.xml')
+# vendor of plugin jars made by --batch --jar unless --vendor is given
+DEFAULT_PLUGIN_VENDOR = 'colorSchemeTool'
+# keys of TextMate settings the converter reads, everything else is dropped while parsing
+TEXTMATE_SETTINGS_KEYS = frozenset(['foreground', 'background', 'fontStyle', 'caret', 'selection', 'lineHighlight', 'invisibles'])
 
 # http://effbot.org/zone/element-lib.htm#prettyprint
 def indent(elem, level=0):
@@ -183,7 +211,44 @@ def load_default_attributes(scheme_path):
             if option_name == 'EFFECT_COLOR': attr_value.default_effect_color = option_value
         default_attributes[name] = attr_value
 
-load_default_attributes('DefaultColorSchemesManager.xml')
+load_default_attributes(DEFAULT_SCHEMES_PATH)
+
+def normalize_options(options):
+    """Brings scheme options to a form where equal values compare equal, dropping the ones with no effect"""
+    result = {}
+    for name, value in options:
+        if not value:
+            continue
+        try:
+            value = int(value, 16)
+        except ValueError:
+            pass
+        result[name] = value
+    if result.get('FONT_TYPE') == 0:
+        del result['FONT_TYPE']
+    # effects are drawn only in a color, boxed (EFFECT_TYPE 0) unless another type is given
+    if 'EFFECT_COLOR' in result:
+        result.setdefault('EFFECT_TYPE', 0)
+    else:
+        result.pop('EFFECT_TYPE', None)
+    return result
+
+def read_scheme_options(scheme):
+    """Returns normalized (colors, attributes) of a scheme element, attributes map names to their options"""
+    colors = {}
+    for option in scheme.findall('./colors/option'):
+        colors.update(normalize_options([(option.attrib.get('name'), option.attrib.get('value'))]))
+    attributes = {}
+    for attr in scheme.findall('./attributes/option'):
+        options = [(option.attrib.get('name'), option.attrib.get('value')) for option in attr.findall('./value/option')]
+        attributes[attr.attrib.get('name')] = normalize_options(options)
+    return colors, attributes
+
+def load_parent_schemes(scheme_path):
+    for scheme in ET.ElementTree(file=scheme_path).findall('.//scheme'):
+        parent_schemes[scheme.attrib.get('name')] = read_scheme_options(scheme)
+
+load_parent_schemes(DEFAULT_SCHEMES_PATH)
 
 for id in [
            "SEARCH_RESULT_ATTRIBUTES",                # EditorColors
@@ -658,6 +723,16 @@ jade_file_path = Attribute("JADE_FILE_PATH", default_string)
 jade_filter_name = Attribute("JADE_FILTER_NAME", default_label)
 jade_js_block = Attribute("JADE_JS_BLOCK", default_identifier)
 
+# attributes and their values before any scheme is loaded, restored by reset_scheme()
+registered_attributes = [(attr, attr.value) for attr in all_attributes]
+
+def reset_scheme():
+    """Forgets everything loaded from a previous scheme, so several schemes can be converted in one process"""
+    all_attributes[:] = [attr for attr, value in registered_attributes]
+    for attr, value in registered_attributes:
+        attr.value = value
+    all_colors.clear()
+
 def color_from_textmate(color, alpha_blend_with=None):
     rgba = color[1:]
     if len(rgba) == 8 and alpha_blend_with:
@@ -697,6 +772,42 @@ def attr_from_textmate(settings, old_value, background):
             result.effect_type = 1
     return result
 
+def parse_scope_selectors(scope_of_setting):
+    """Splits scope selectors of a setting into (matching scope, selector size) pairs used by find_by_scope"""
+    if not isinstance(scope_of_setting, list):
+        scopes_of_setting = scope_of_setting.split(",")
+    else:
+        scopes_of_setting = scope_of_setting
+
+    selectors = []
+    for aScope in scopes_of_setting:
+        aScope = aScope.strip()
+
+        # ignore excludes in scopes selectors,
+        # more accurate parsing/matching required!
+        chain_without_excludes = aScope.split(' -')[0]
+        aScope_selectors = chain_without_excludes.split(' ')
+
+        # We need:
+        # 1. "Match the element deepest down in the scope e.g. string wins over source.php when the scope is source.php string.quoted."
+        # it is very simple implementation of above rule
+        matchingScope = aScope_selectors[-1]
+
+        # Consider scope size as scope size until first not excluded element
+        aScopeSelectorSize = 0
+        for i in range(0, len(aScope_selectors) - 1):
+            aScopeSelectorSize = len(aScope_selectors[i].strip())
+        selectors.append((matchingScope, aScopeSelectorSize))
+    return selectors
+
+def normalize_settings(all_settings):
+    """Pre-splits scopes of TextMate settings, so they are not parsed again for every attribute"""
+    for setting in all_settings:
+        scope_of_setting = setting.get('scope', None)
+        if scope_of_setting is not None:
+            setting['selectors'] = parse_scope_selectors(scope_of_setting)
+    return all_settings
+
 def find_by_scope(settings, scope):
     # compound scope
     less_specific = None
@@ -710,30 +821,11 @@ def find_by_scope(settings, scope):
         if scope_of_setting is None:
             if scope is None: return setting
         else:
-            if not isinstance(scope_of_setting, list):
-                scopes_of_setting = scope_of_setting.split(",")
-            else:
-                scopes_of_setting = scope_of_setting
-
-            for aScope in scopes_of_setting:
-                aScope = aScope.strip()
+            selectors = setting.get('selectors', None)
+            if selectors is None:
+                selectors = parse_scope_selectors(scope_of_setting)
 
-                # ignore excludes in scopes selectors,
-                # more accurate parsing/matching required!
-                chain_without_excludes = aScope.split(' -')[0]
-                aScope_selectors = chain_without_excludes.split(' ')
-
-                # We need:
-                # 1. "Match the element deepest down in the scope e.g. string wins over source.php when the scope is source.php string.quoted."
-                # it is very simple implementation of above rule
-                matchingScope = aScope_selectors[-1]
-                if matchingScope is None:
-                    continue
-
-                # Consider scope size as scope size until first not excluded element
-                aScopeSelectorSize = 0
-                for i in range(0, len(aScope_selectors) - 1):
-                    aScopeSelectorSize = len(aScope_selectors[i].strip())
+            for matchingScope, aScopeSelectorSize in selectors:
                 isSimpleScope = (aScopeSelectorSize == 0)
 
                 if matchingScope == scope:
@@ -768,16 +860,175 @@ def find_by_scope(settings, scope):
 
     return ss_less_specific if (ss_less_specific is not None) else less_specific
 
-def load_textmate_scheme(tmtheme):
-    themeDict = None
+class TextMateSettingsReader:
+    """Streams a TextMate plist and builds only the entries of its 'settings' array"""
+    def __init__(self):
+        self.settings = []
+        # (kind, container) for every open <dict>/<array>, container is None for skipped ones
+        self.stack = []
+        self.key = None
+        self.text = None
+        self.target = None
+
+    def parse(self, f):
+        parser = expat.ParserCreate()
+        parser.StartElementHandler = self.start_element
+        parser.EndElementHandler = self.end_element
+        parser.CharacterDataHandler = self.character_data
+        parser.ParseFile(f)
+        return self.settings
+
+    def start_element(self, name, attrs):
+        kind = self.stack[-1][0] if self.stack else None
+        if name == 'plist' or kind == 'skip':
+            if name in ('dict', 'array'):
+                self.stack.append(('skip', None))
+            return
+        if name == 'key':
+            self.text = []
+            return
+
+        key = self.key
+        self.key = None
+        container = self.stack[-1][1] if self.stack else None
+        if name == 'dict':
+            if kind is None:
+                self.stack.append(('root', None))
+            elif kind == 'settings':
+                rule = {}
+                container.append(rule)
+                self.stack.append(('rule', rule))
+            elif kind == 'rule' and key == 'settings':
+                container['settings'] = {}
+                self.stack.append(('rule_settings', container['settings']))
+            else:
+                self.stack.append(('skip', None))
+        elif name == 'array':
+            if kind == 'root' and key == 'settings':
+                self.stack.append(('settings', self.settings))
+            elif kind == 'rule' and key == 'scope':
+                container['scope'] = []
+                self.stack.append(('scopes', container['scope']))
+            else:
+                self.stack.append(('skip', None))
+        elif name == 'string' and ((kind == 'rule' and key in ('scope', 'name')) or
+                                   (kind == 'rule_settings' and key in TEXTMATE_SETTINGS_KEYS) or
+                                   kind == 'scopes'):
+            self.text = []
+            self.target = (container, key)
+
+    def end_element(self, name):
+        if name in ('dict', 'array'):
+            kind, container = self.stack.pop()
+            if kind == 'rule' and 'scope' in container:
+                container['selectors'] = parse_scope_selectors(container['scope'])
+        elif self.text is not None:
+            value = "".join(self.text)
+            self.text = None
+            if name == 'key':
+                self.key = value
+            else:
+                container, key = self.target
+                if isinstance(container, list):
+                    container.append(value)
+                else:
+                    container[key] = value
+
+    def character_data(self, data):
+        if self.text is not None:
+            self.text.append(data)
+
+def source_fingerprint(*functions):
+    """Hash of the source of functions, so cache entries made by a different version of them are not reused"""
+    digest = hashlib.sha1()
+    try:
+        for function in functions:
+            digest.update(inspect.getsource(function).encode('utf-8'))
+    except (OSError, TypeError):
+        # no sources to look at (e.g. installed as .pyc only), cache versions are all we have then
+        return ''
+    return digest.hexdigest()
+
+# normalized settings carry pre-split selectors, so they depend on the reader and the splitting code
+SETTINGS_FINGERPRINT = source_fingerprint(normalize_settings, parse_scope_selectors,
+                                          *[member for member in vars(TextMateSettingsReader).values()
+                                            if inspect.isfunction(member)])
+# scope resolutions depend on the matching code
+MATCHER_FINGERPRINT = source_fingerprint(parse_scope_selectors, find_by_scope)
+
+def read_cache_entry(cache_dir, name):
+    try:
+        with open(os.path.join(cache_dir, name), 'rb') as f:
+            return pickle.load(f)
+    except (OSError, EOFError, ValueError, pickle.UnpicklingError):
+        return None
+
+def write_cache_entry(cache_dir, name, value):
+    os.makedirs(cache_dir, exist_ok=True)
+    # write to a temporary file first, concurrent runs must never see a partially written entry
+    fd, tmp_path = tempfile.mkstemp(dir=cache_dir, suffix='.tmp')
+    with os.fdopen(fd, 'wb') as f:
+        pickle.dump(value, f, pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, os.path.join(cache_dir, name))
+
+def load_textmate_settings(tmtheme, cache_dir=None):
+    """Returns normalized settings of a TextMate scheme, reusing the copy cached by the scheme file hash if any"""
+    cache_name = None
     with open(tmtheme, 'rb') as f:
-        themeDict = plistlib.load(f)
-    all_settings = themeDict['settings']
+        if cache_dir:
+            # hash the file in chunks, so a cache hit doesn't need the parser nor the whole file in memory
+            digest = hashlib.sha1()
+            for chunk in iter(lambda: f.read(65536), b''):
+                digest.update(chunk)
+            digest.update(SETTINGS_FINGERPRINT.encode('ascii'))
+            cache_name = "{0}.v{1}.pickle".format(digest.hexdigest(), SETTINGS_CACHE_VERSION)
+            all_settings = read_cache_entry(cache_dir, cache_name)
+            if all_settings is not None:
+                return all_settings
+            f.seek(0)
+
+        binary = f.read(6) == b'bplist'
+        f.seek(0)
+        if binary:
+            all_settings = normalize_settings(plistlib.load(f)['settings'])
+        else:
+            all_settings = TextMateSettingsReader().parse(f)
+
+    if cache_name:
+        write_cache_entry(cache_dir, cache_name, all_settings)
+    return all_settings
+
+def resolve_scopes(all_settings, cache_dir=None):
+    """Maps every attribute scope (and None for the default settings) to the index of the setting find_by_scope
+    picks for it. Forks of a theme usually differ in colors only, so resolutions are shared between schemes
+    with the same scopes for the whole batch, and across runs through cache_dir."""
+    attribute_scopes = sorted(set(attr.scope for attr in all_attributes if attr.scope))
+    # keyed on the pre-split selectors, so scopes only spaced differently share a resolution
+    setting_selectors = [setting.get('selectors') for setting in all_settings]
+    key = hashlib.sha1(pickle.dumps((MATCHER_FINGERPRINT, attribute_scopes, setting_selectors),
+                                    pickle.HIGHEST_PROTOCOL)).hexdigest()
+
+    resolution = scope_resolutions.get(key)
+    cache_name = "{0}.scopes.v{1}.pickle".format(key, SETTINGS_CACHE_VERSION)
+    if resolution is None and cache_dir:
+        resolution = read_cache_entry(cache_dir, cache_name)
+    if resolution is None:
+        resolution = {}
+        for scope in [None] + attribute_scopes:
+            setting = find_by_scope(all_settings, scope)
+            resolution[scope] = next((i for i, s in enumerate(all_settings) if s is setting), None)
+        if cache_dir:
+            write_cache_entry(cache_dir, cache_name, resolution)
+    scope_resolutions[key] = resolution
+    return resolution
+
+def load_textmate_scheme(tmtheme, cache_dir=None):
+    all_settings = load_textmate_settings(tmtheme, cache_dir)
+    resolution = resolve_scopes(all_settings, cache_dir)
     used_scopes = set()
-    default_settings = find_by_scope(all_settings, None)
-    if not default_settings:
-        print("Cannot find default settings")
-        return
+    if resolution[None] is None:
+        raise ValueError("Cannot find default settings in " + tmtheme)
+    default_settings = all_settings[resolution[None]]
     default_settings = default_settings['settings']
 
     text.value = attr_from_textmate(default_settings, None, None)
@@ -826,7 +1077,8 @@ def load_textmate_scheme(tmtheme):
 
     for attr in all_attributes:
         if attr.scope:
-            settings = find_by_scope(all_settings, attr.scope)
+            index = resolution[attr.scope]
+            settings = all_settings[index] if index is not None else None
             if settings:
                 the_scope = settings['scope']
                 if the_scope:
@@ -873,12 +1125,57 @@ def removeNoneAttrib(elem):
     for subelem in elem:
         removeNoneAttrib(subelem)
 
-def write_idea_scheme(filename):
-    name, ext = os.path.splitext(os.path.basename(filename))
+def attribute_options(attr):
+    """Returns (name, value) options to write for the attribute, or None if it just refers to its parent"""
+    fore = attr.value.foreground
+    back = attr.value.background
+    saveFg = fore and (fore != IGNORE_COLOR_VALUE)
+    saveBg = back and (back != IGNORE_COLOR_VALUE)
+    if not (saveFg or saveBg or attr.value.font_style or attr.value.effect_type or attr.value.error_stripe):
+        return None
+    options = []
+    if saveFg: options.append(('FOREGROUND', fore))
+    if saveBg: options.append(('BACKGROUND', back))
+    if attr.value.font_style:
+        options.append(('FONT_TYPE', str(attr.value.font_style)))
+    if attr.value.effect_type:
+        options.append(('EFFECT_TYPE', str(attr.value.effect_type)))
+        if attr.value.effect_color:
+            options.append(('EFFECT_COLOR', attr.value.effect_color))
+        elif fore:
+            options.append(('EFFECT_COLOR', fore))
+        else:
+            options.append(('EFFECT_COLOR', text.value.foreground))
+    if attr.value.error_stripe:
+        options.append(('ERROR_STRIPE_COLOR', attr.value.error_stripe))
+    return options
+
+def resolved_options(attr):
+    options = attribute_options(attr)
+    while options is None and attr.parent is not None:
+        attr = attr.parent
+        options = attribute_options(attr)
+    return options or []
+
+def write_idea_scheme(filename, minimal=False, name=None):
+    """Writes the scheme to filename, a path or a binary file object, named after the file unless name is given"""
+    if name is None:
+        name, ext = os.path.splitext(os.path.basename(filename))
     baseName = "Darcula" if isDark() else "Default"
     scheme = ET.Element("scheme", name=underscore_to_camelcase(name), version="1", parent_scheme=baseName)
+
+    # in minimal mode everything the parent scheme already provides is left out
+    parent_colors, parent_attributes = {}, {}
+    if minimal:
+        if baseName in parent_schemes:
+            parent_colors, parent_attributes = parent_schemes[baseName]
+        else:
+            print("[!] values of parent scheme " + baseName + " are unknown, writing all attributes")
+
     colors = ET.SubElement(scheme, 'colors')
     for name, value in all_colors.items():
+        if name in parent_colors and normalize_options([(name, value)]).get(name) == parent_colors[name]:
+            continue
         ET.SubElement(colors, 'option', name=name, value=value)
     attributes = ET.SubElement(scheme, 'attributes')
 
@@ -886,31 +1183,18 @@ def write_idea_scheme(filename):
     all_attributes.sort(key=lambda attr: attr.id)
 
     for attr in all_attributes:
+        if attr.id in parent_attributes and normalize_options(resolved_options(attr)) == parent_attributes[attr.id]:
+            continue
         if attr.value.inherited:
             print('inheriting ' + attr.id + ' from ' + attr.parent.id)
         elif isinstance(attr.value, DerivedAttributeValue):
             print('transforming IDEA default color for ' + attr.id)
-        fore = attr.value.foreground
-        back = attr.value.background
-        saveFg = fore and (fore != IGNORE_COLOR_VALUE)
-        saveBg = back and (back != IGNORE_COLOR_VALUE)
-        if saveFg or saveBg or attr.value.font_style or attr.value.effect_type or attr.value.error_stripe:
+        options = attribute_options(attr)
+        if options is not None:
             option = ET.SubElement(attributes, 'option', name=attr.id)
             value = ET.SubElement(option, 'value')
-            if saveFg: ET.SubElement(value, 'option', name='FOREGROUND', value=fore)
-            if saveBg: ET.SubElement(value, 'option', name='BACKGROUND', value=back)
-            if attr.value.font_style:
-                ET.SubElement(value, 'option', name='FONT_TYPE', value=str(attr.value.font_style))
-            if attr.value.effect_type:
-                ET.SubElement(value, 'option', name='EFFECT_TYPE', value=str(attr.value.effect_type))
-                if attr.value.effect_color:
-                    ET.SubElement(value, 'option', name='EFFECT_COLOR', value=attr.value.effect_color)
-                elif fore:
-                    ET.SubElement(value, 'option', name='EFFECT_COLOR', value=fore)
-                else:
-                    ET.SubElement(value, 'option', name='EFFECT_COLOR', value=text.value.foreground)
-            if attr.value.error_stripe:
-                ET.SubElement(value, 'option', name='ERROR_STRIPE_COLOR', value=attr.value.error_stripe)
+            for option_name, option_value in options:
+                ET.SubElement(value, 'option', name=option_name, value=option_value)
         else:
             ET.SubElement(attributes, 'option', name=attr.id, baseAttributes=attr.parent.id)
     indent(scheme)
@@ -919,15 +1203,207 @@ def write_idea_scheme(filename):
     removeNoneAttrib(tree.getroot())
     tree.write(filename)
 
-if len(sys.argv) != 3:
-    print('Usage: colorSchemeTool <TextMate scheme> <IDEA/PyCharm/RubyMine scheme>')
-    exit(1)
-
-all_settings, used_scopes = load_textmate_scheme(sys.argv[1])
-write_idea_scheme(sys.argv[2])
-
-for setting in all_settings:
-    scope = setting.get('scope', None)
-    if scope and not scope in used_scopes:
-        print("Unused scope: " + scope)
-
+def convert_scheme(tmtheme, icls, cache_dir=None, minimal=False, name=None):
+    """Converts tmtheme and writes it with write_idea_scheme(), returns whether the scheme is dark"""
+    reset_scheme()
+    all_settings, used_scopes = load_textmate_scheme(tmtheme, cache_dir)
+    write_idea_scheme(icls, minimal, name)
+
+    for setting in all_settings:
+        scope = setting.get('scope', None)
+        if scope and not scope in used_scopes:
+            print("Unused scope: " + scope)
+    return isDark()
+
+def batch_worker(conn, cache_dir, minimal):
+    """Converts schemes sent by convert_batch() until it sends None, replying with a status record for each"""
+    while True:
+        task = conn.recv()
+        if task is None:
+            return
+        tmtheme, icls = task
+        try:
+            if icls is not None:
+                conn.send({'status': 'ok', 'dark': convert_scheme(tmtheme, icls, cache_dir, minimal)})
+            else:
+                # the scheme goes back to convert_batch(), which packs it into the plugin jar
+                scheme = io.BytesIO()
+                name, ext = os.path.splitext(os.path.basename(tmtheme))
+                dark = convert_scheme(tmtheme, scheme, cache_dir, minimal, name)
+                conn.send({'status': 'ok', 'dark': dark, 'scheme': scheme.getvalue()})
+        except Exception as e:
+            conn.send({'status': 'error', 'error': type(e).__name__, 'message': str(e)})
+
+class BatchWorker:
+    def __init__(self, cache_dir, minimal):
+        self.conn, child_conn = multiprocessing.Pipe()
+        self.process = multiprocessing.Process(target=batch_worker, args=(child_conn, cache_dir, minimal))
+        self.process.daemon = True
+        self.process.start()
+        child_conn.close()
+        self.task = None
+        self.started = None
+
+    def submit(self, task):
+        self.task = task
+        self.started = time.time()
+        self.conn.send(task)
+
+    def stop(self):
+        try:
+            self.conn.send(None)
+        except OSError:
+            pass
+        self.process.join(1)
+        if self.process.is_alive():
+            self.process.terminate()
+
+    def kill(self):
+        self.process.terminate()
+        self.process.join()
+        self.conn.close()
+
+def plugin_descriptor(plugin_id, plugin_name, vendor, schemes):
+    """Builds plugin.xml bundling schemes, a list of (scheme name, dark) pairs"""
+    plugin = ET.Element('idea-plugin')
+    ET.SubElement(plugin, 'id').text = plugin_id
+    ET.SubElement(plugin, 'name').text = underscore_to_camelcase(plugin_name)
+    ET.SubElement(plugin, 'version').text = '1.0'
+    ET.SubElement(plugin, 'vendor').text = vendor
+    dark = len([name for name, is_dark in schemes if is_dark])
+    ET.SubElement(plugin, 'description').text = "{0} color schemes converted from TextMate: {1} dark, {2} light.".format(
+        len(schemes), dark, len(schemes) - dark)
+    ET.SubElement(plugin, 'depends').text = 'com.intellij.modules.lang'
+    extensions = ET.SubElement(plugin, 'extensions', defaultExtensionNs='com.intellij')
+    for name, is_dark in schemes:
+        ET.SubElement(extensions, 'bundledColorScheme', path='/colors/' + name)
+    indent(plugin)
+    return ET.tostring(plugin)
+
+def convert_batch(tm_dir, icls_dir, cache_dir=None, minimal=False, jobs=None, timeout=60, report=None, jar=False,
+                  plugin_id=None, vendor=DEFAULT_PLUGIN_VENDOR):
+    """Converts every TextMate scheme of tm_dir in worker processes, a worker exceeding timeout seconds
+    on a scheme is killed and replaced. With jar, icls_dir is the plugin jar to pack the schemes into,
+    plugin_id defaults to the jar name in the colorSchemeTool namespace.
+    Returns the number of schemes that failed."""
+    tasks = []
+    records = []
+    # scheme name -> theme it was taken from, jar entries are named after schemes and must be unique
+    scheme_names = {}
+    for name in sorted(os.listdir(tm_dir)):
+        base, ext = os.path.splitext(name)
+        if ext != '.tmTheme':
+            continue
+        tmtheme = os.path.join(tm_dir, name)
+        if jar:
+            scheme_name = underscore_to_camelcase(base)
+            if scheme_name in scheme_names:
+                record = {'status': 'error', 'error': 'DuplicateSchemeName', 'theme': tmtheme, 'seconds': 0,
+                          'message': 'scheme name {0} is already taken by {1}'.format(scheme_name, scheme_names[scheme_name])}
+                records.append(record)
+                sys.stderr.write(json.dumps(record) + "\n")
+                continue
+            scheme_names[scheme_name] = tmtheme
+        tasks.append((tmtheme, None if jar else os.path.join(icls_dir, base + '.icls')))
+    tasks.reverse()
+
+    plugin_jar = None
+    # (scheme name, dark) of the schemes packed into the jar
+    bundled_schemes = []
+    if jar:
+        plugin_jar = zipfile.ZipFile(icls_dir, 'w', zipfile.ZIP_DEFLATED)
+    else:
+        os.makedirs(icls_dir, exist_ok=True)
+
+    workers = [BatchWorker(cache_dir, minimal) for i in range(min(jobs or os.cpu_count(), len(tasks)))]
+
+    def finish(worker, record):
+        if 'scheme' in record:
+            base, ext = os.path.splitext(os.path.basename(worker.task[0]))
+            name = underscore_to_camelcase(base)
+            plugin_jar.writestr('colors/' + name + '.xml', record.pop('scheme'))
+            bundled_schemes.append((name, record['dark']))
+        record['theme'] = worker.task[0]
+        record['seconds'] = round(time.time() - worker.started, 3)
+        records.append(record)
+        if record['status'] != 'ok':
+            sys.stderr.write(json.dumps(record) + "\n")
+        worker.task = None
+
+    while tasks or any(worker.task for worker in workers):
+        for worker in workers:
+            if worker.task is None and tasks:
+                worker.submit(tasks.pop())
+        busy = [worker for worker in workers if worker.task]
+        deadline = min(worker.started for worker in busy) + timeout
+        ready = multiprocessing.connection.wait([worker.conn for worker in busy], max(deadline - time.time(), 0))
+        for i, worker in enumerate(workers):
+            if not worker.task:
+                continue
+            if worker.conn in ready:
+                try:
+                    finish(worker, worker.conn.recv())
+                    continue
+                except EOFError:
+                    worker.process.join(1)
+                    record = {'status': 'crashed', 'error': 'WorkerExited',
+                              'message': 'worker exited with code {0}'.format(worker.process.exitcode)}
+            elif time.time() - worker.started >= timeout:
+                record = {'status': 'timeout', 'error': 'TimeoutError',
+                          'message': 'conversion took longer than {0} seconds'.format(timeout)}
+            else:
+                continue
+            worker.kill()
+            workers[i] = BatchWorker(cache_dir, minimal)
+            finish(worker, record)
+
+    for worker in workers:
+        worker.stop()
+
+    if plugin_jar:
+        plugin_name, ext = os.path.splitext(os.path.basename(icls_dir))
+        if plugin_id is None:
+            plugin_id = 'colorSchemeTool.' + plugin_name
+        plugin_jar.writestr('META-INF/plugin.xml', plugin_descriptor(plugin_id, plugin_name, vendor, sorted(bundled_schemes)))
+        plugin_jar.close()
+
+    if report:
+        with open(report, 'w') as f:
+            for record in records:
+                f.write(json.dumps(record) + "\n")
+    failed = len([record for record in records if record['status'] != 'ok'])
+    print("converted {0} schemes, {1} failed".format(len(records) - failed, failed))
+    return failed
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(prog='colorSchemeTool')
+    parser.add_argument('tmtheme', metavar='<TextMate scheme>', help='with --batch, directory of TextMate schemes')
+    parser.add_argument('icls', metavar='<IDEA/PyCharm/RubyMine scheme>', help='with --batch, output directory')
+    parser.add_argument('--cache-dir', help='directory to keep parsed TextMate schemes in, keyed by file hash')
+    parser.add_argument('--minimal', action='store_true',
+                        help='leave out colors and attributes equal to the ones of the parent scheme')
+    parser.add_argument('--batch', action='store_true', help='convert every .tmTheme file of a directory')
+    parser.add_argument('--jobs', type=int, help='number of batch worker processes (default: CPU count)')
+    parser.add_argument('--timeout', type=float, default=60, help='seconds a batch worker may spend on one scheme')
+    parser.add_argument('--jar', action='store_true',
+                        help='with --batch, pack the schemes into the plugin jar given instead of the output directory')
+    parser.add_argument('--plugin-id', help='with --jar, id of the plugin (default: colorSchemeTool.<jar name>)')
+    parser.add_argument('--vendor', default=DEFAULT_PLUGIN_VENDOR,
+                        help='with --jar, vendor of the plugin (default: %(default)s)')
+    parser.add_argument('--report', help='file to write a JSON status record per converted scheme to')
+    args = parser.parse_args()
+    if args.jar and not args.batch:
+        parser.error('--jar requires --batch')
+    if (args.plugin_id or args.vendor != DEFAULT_PLUGIN_VENDOR) and not args.jar:
+        parser.error('--plugin-id and --vendor require --jar')
+
+    if args.batch:
+        failed = convert_batch(args.tmtheme, args.icls, args.cache_dir, args.minimal, args.jobs, args.timeout, args.report,
+                               args.jar, args.plugin_id, args.vendor)
+        sys.exit(1 if failed else 0)
+
+    try:
+        convert_scheme(args.tmtheme, args.icls, args.cache_dir, args.minimal)
+    except ValueError as e:
+        print(e)
+        sys.exit(1)
@@ -5,6 +5,8 @@ TM_OUTDIR=./tmThemes/
 
 shopt -s nullglob
 
+# all themes go to a single node run, so base themes they include are parsed once
+VSC_ARGS=()
 for FILE in $VSC_FILES
 do
     FN="${FILE##*/}"
@@ -12,21 +14,15 @@ do
     BASE="${FN%.[^.]*}"
     EXT="${FN:${#BASE} + 1}"
     echo converting $DIR$FN to $TM_OUTDIR$BASE.tmTheme ...
-	node vscToTm.js "$FILE" "$TM_OUTDIR$BASE.tmTheme" >> ./colorSchemeTool.log
+    VSC_ARGS+=("$FILE" "$TM_OUTDIR$BASE.tmTheme")
 done
+if [ ${#VSC_ARGS[@]} -gt 0 ]; then
+	node vscToTm.js "${VSC_ARGS[@]}" >> ./colorSchemeTool.log
+fi
 
 
-TM_FILES=./tmThemes/*.tmTheme
+TM_DIR=./tmThemes/
 IJ_OUTDIR=./intellijThemes/
 
-shopt -s nullglob
-
-for FILE in $TM_FILES
-do
-    FN="${FILE##*/}"
-    DIR="${FILE:0:${#FILE} - ${#FN}}"
-    BASE="${FN%.[^.]*}"
-    EXT="${FN:${#BASE} + 1}"
-    echo converting $DIR$FN to $IJ_OUTDIR$BASE.icls ...
-	python colorSchemeTool.py "$FILE" "$IJ_OUTDIR$BASE.icls" >> ./colorSchemeTool.log
-done
+echo converting $TM_DIR to $IJ_OUTDIR ...
+python colorSchemeTool.py --batch "$TM_DIR" "$IJ_OUTDIR" >> ./colorSchemeTool.log
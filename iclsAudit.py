@@ -0,0 +1,125 @@
+import argparse
+import multiprocessing
+import os.path
+import sys
+import xml.etree.ElementTree as ET
+
+import numpy as np
+
+# parent schemes are read and normalized the same way the converter compares against them in minimal mode
+from colorSchemeTool import parent_schemes, read_scheme_options
+from iclsDiff import list_schemes
+
+# backgrounds every attribute foreground is checked against, in column order of the color table
+BACKGROUNDS = ['background', 'SELECTION_BACKGROUND', 'CARET_ROW_COLOR']
+NO_COLOR = -1
+
+def load_scheme(path):
+    """Returns the parent scheme name, colors, options of attributes and baseAttributes of the ones referring to
+    another, with colors and attributes left to the parent scheme added the way the IDE shows them"""
+    scheme = ET.parse(path).getroot()
+    parent = scheme.get('parent_scheme')
+    colors, attributes = read_scheme_options(scheme)
+    bases = dict((option.get('name'), option.get('baseAttributes'))
+                 for option in scheme.findall('./attributes/option') if option.get('baseAttributes') is not None)
+    for name in bases:
+        attributes.pop(name, None)
+    if parent in parent_schemes:
+        parent_colors, parent_attributes = parent_schemes[parent]
+        colors = dict(parent_colors, **colors)
+        for name, options in parent_attributes.items():
+            if name not in attributes and name not in bases:
+                attributes[name] = options
+    return parent, colors, attributes, bases
+
+def resolve_option(attributes, bases, name, option):
+    # attributes without a value of their own take it from their baseAttributes
+    seen = set()
+    while name not in seen:
+        seen.add(name)
+        if name in attributes:
+            return attributes[name].get(option)
+        name = bases.get(name)
+    return None
+
+def color_value(value):
+    return NO_COLOR if value is None else value
+
+def load_scheme_colors(path):
+    """Returns the parent scheme name and (scheme, attribute, foreground, background, selection, caret row)
+    rows for every attribute, colors not set by the attribute are taken from TEXT"""
+    parent, colors, attributes, bases = load_scheme(path)
+    scheme = os.path.basename(path)
+    text_fore = resolve_option(attributes, bases, 'TEXT', 'FOREGROUND')
+    text_back = resolve_option(attributes, bases, 'TEXT', 'BACKGROUND')
+    selection = color_value(colors.get('SELECTION_BACKGROUND'))
+    caret_row = color_value(colors.get('CARET_ROW_COLOR'))
+    rows = []
+    for name in sorted(set(attributes) | set(bases)):
+        fore = resolve_option(attributes, bases, name, 'FOREGROUND')
+        back = resolve_option(attributes, bases, name, 'BACKGROUND')
+        # black is 0, so missing colors are told by None
+        if fore is None:
+            fore = text_fore
+        if back is None:
+            back = text_back
+        if fore is None:
+            continue
+        rows.append((scheme, name, color_value(fore), color_value(back), selection, caret_row))
+    return parent, rows
+
+def relative_luminance(colors):
+    """WCAG relative luminance of an array of 0xRRGGBB colors, NaN where there is no color"""
+    rgb = np.stack([(colors >> 16) & 0xFF, (colors >> 8) & 0xFF, colors & 0xFF], axis=-1) / 255.0
+    linear = np.where(rgb <= 0.03928, rgb / 12.92, ((rgb + 0.055) / 1.055) ** 2.4)
+    luminance = linear @ np.array([0.2126, 0.7152, 0.0722])
+    luminance[colors == NO_COLOR] = np.nan
+    return luminance
+
+def contrast_ratios(colors):
+    """Contrast of the first column of colors against each of the others, NaN where a color is missing"""
+    luminance = relative_luminance(colors)
+    fore = luminance[:, :1]
+    backs = luminance[:, 1:]
+    return (np.maximum(fore, backs) + 0.05) / (np.minimum(fore, backs) + 0.05)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(prog='iclsAudit',
+                                     description='Reports attributes of IDEA schemes with low WCAG contrast')
+    parser.add_argument('schemes', metavar='<schemes dir>')
+    parser.add_argument('--min-contrast', type=float, default=3.0,
+                        help='lowest acceptable contrast ratio (default: 3.0, WCAG AA for large text)')
+    parser.add_argument('--jobs', type=int, default=None, help='number of processes loading schemes (default: CPU count)')
+    args = parser.parse_args()
+
+    paths = [os.path.join(args.schemes, name) for name in sorted(list_schemes(args.schemes))]
+    pool = multiprocessing.Pool(args.jobs)
+    rows = []
+    # parent scheme name -> number of schemes, for parents DefaultColorSchemesManager.xml doesn't define
+    unknown_parents = {}
+    for parent, scheme_rows in pool.imap(load_scheme_colors, paths, chunksize=16):
+        rows.extend(scheme_rows)
+        if parent and parent not in parent_schemes:
+            unknown_parents[parent] = unknown_parents.get(parent, 0) + 1
+    pool.close()
+    pool.join()
+
+    colors = np.array([row[2:] for row in rows], dtype=np.int64).reshape(-1, 1 + len(BACKGROUNDS))
+    ratios = contrast_ratios(colors)
+    # NaN never compares below the limit, so missing backgrounds are not reported
+    low = ratios < args.min_contrast
+
+    for index in np.flatnonzero(low.any(axis=1)):
+        scheme, name = rows[index][:2]
+        checks = ["{0} {1:.2f}".format(BACKGROUNDS[column], ratios[index, column])
+                  for column in np.flatnonzero(low[index])]
+        print("{0}: {1} {2}".format(scheme, name, ", ".join(checks)))
+
+    print("audited {0} attributes of {1} schemes against contrast {2}".format(len(rows), len(paths), args.min_contrast))
+    for column, background in enumerate(BACKGROUNDS):
+        print("  {0}: {1} below".format(background, int(low[:, column].sum())))
+    for parent, count in sorted(unknown_parents.items()):
+        print("  [!] parent scheme {0} of {1} schemes is unknown, attributes left to it are not audited".format(parent, count))
+
+    if low.any():
+        sys.exit(1)
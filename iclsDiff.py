@@ -0,0 +1,104 @@
+import argparse
+try:
+    import xml.etree.cElementTree as ET
+except ImportError:
+    # cElementTree is gone since Python 3.9
+    import xml.etree.ElementTree as ET
+import multiprocessing
+import os.path
+import sys
+
+# attribute options holding colors, everything in the colors block is a color too
+COLOR_OPTIONS = frozenset(['FOREGROUND', 'BACKGROUND', 'EFFECT_COLOR', 'ERROR_STRIPE_COLOR'])
+
+def load_icls(path):
+    """Loads a scheme into a table of (attribute or 'colors', option) -> value"""
+    return scheme_table(ET.parse(path).getroot())
+
+def scheme_table(scheme):
+    table = {}
+    table[('scheme', 'parent_scheme')] = scheme.get('parent_scheme')
+    for option in scheme.findall('./colors/option'):
+        table[('colors', option.get('name'))] = normalize_color(option.get('value'))
+    for option in scheme.findall('./attributes/option'):
+        name = option.get('name')
+        base = option.get('baseAttributes')
+        if base is not None:
+            table[(name, 'baseAttributes')] = base
+        for value in option.findall('./value/option'):
+            option_name = value.get('name')
+            option_value = value.get('value')
+            table[(name, option_name)] = normalize_color(option_value) if option_name in COLOR_OPTIONS else option_value
+    return table
+
+def normalize_color(value):
+    # colors are written both as 'ffffff' and 'FFFFFF', and leading zeroes may be omitted
+    if value is None:
+        return None
+    try:
+        return "{0:06X}".format(int(value, 16))
+    except ValueError:
+        return value
+
+def diff_tables(old, new):
+    diffs = []
+    for key in sorted(set(old) | set(new)):
+        old_value = old.get(key)
+        new_value = new.get(key)
+        if old_value != new_value:
+            diffs.append((key[0], key[1], old_value, new_value))
+    return diffs
+
+def diff_schemes(paths):
+    old_path, new_path = paths
+    return os.path.basename(old_path), diff_tables(load_icls(old_path), load_icls(new_path))
+
+def list_schemes(directory):
+    return set(name for name in os.listdir(directory) if name.endswith('.icls'))
+
+def format_value(value):
+    return '<none>' if value is None else value
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(prog='iclsDiff',
+                                     description='Reports attribute differences between two directories of IDEA schemes')
+    parser.add_argument('old', metavar='<old schemes dir>')
+    parser.add_argument('new', metavar='<new schemes dir>')
+    parser.add_argument('--jobs', type=int, default=None, help='number of worker processes (default: CPU count)')
+    parser.add_argument('--details', action='store_true', help='print every changed option, not only the summary')
+    args = parser.parse_args()
+
+    old_schemes = list_schemes(args.old)
+    new_schemes = list_schemes(args.new)
+    common = sorted(old_schemes & new_schemes)
+    pairs = [(os.path.join(args.old, name), os.path.join(args.new, name)) for name in common]
+
+    pool = multiprocessing.Pool(args.jobs)
+    results = sorted(pool.imap_unordered(diff_schemes, pairs, chunksize=16))
+    pool.close()
+    pool.join()
+
+    # (attribute, option) -> number of schemes where it changed
+    changed_options = {}
+    changed_schemes = 0
+    for name, diffs in results:
+        if not diffs:
+            continue
+        changed_schemes += 1
+        for attribute, option, old_value, new_value in diffs:
+            changed_options[(attribute, option)] = changed_options.get((attribute, option), 0) + 1
+            if args.details:
+                print("{0}: {1} {2} {3} -> {4}".format(name, attribute, option, format_value(old_value), format_value(new_value)))
+
+    for name in sorted(old_schemes - new_schemes):
+        print("only in " + args.old + ": " + name)
+    for name in sorted(new_schemes - old_schemes):
+        print("only in " + args.new + ": " + name)
+
+    print("compared {0} schemes: {1} changed, {2} only in old, {3} only in new".format(
+        len(common), changed_schemes, len(old_schemes - new_schemes), len(new_schemes - old_schemes)))
+    for (attribute, option), count in sorted(changed_options.items(), key=lambda item: (-item[1], item[0])):
+        print("  {0} {1}: {2} schemes".format(attribute, option, count))
+
+    if changed_schemes or old_schemes != new_schemes:
+        sys.exit(1)
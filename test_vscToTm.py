@@ -0,0 +1,66 @@
+import json
+import os.path
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+import xml.etree.ElementTree as ET
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+def write_json(path, value):
+    with open(path, 'w') as f:
+        json.dump(value, f)
+
+def foreground(icls, attribute):
+    option = ET.parse(icls).getroot().find("./attributes/option[@name='" + attribute + "']/value/option[@name='FOREGROUND']")
+    return option.get('value') if option is not None else None
+
+@unittest.skipUnless(shutil.which('node') and os.path.isdir(os.path.join(ROOT, 'node_modules')), 'node is required')
+class IncludeTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+        write_json(os.path.join(self.dir, 'base.json'), {
+            'tokenColors': [
+                {'settings': {'foreground': '#000000', 'background': '#ffffff'}},
+                {'scope': 'string', 'settings': {'foreground': '#ff0000'}},
+                {'scope': ['comment', 'keyword'], 'settings': {'foreground': '#00ff00'}},
+            ]})
+        write_json(os.path.join(self.dir, 'child.json'), {
+            'name': 'Child',
+            'include': './base.json',
+            'tokenColors': [
+                {'settings': {'foreground': '#222222'}},
+                {'scope': 'string', 'settings': {'foreground': '#0000ff'}},
+                {'scope': 'keyword', 'settings': {'foreground': '#abcdef'}},
+            ]})
+
+    def convert(self, *names):
+        args = []
+        for name in names:
+            args += [os.path.join(self.dir, name + '.json'), os.path.join(self.dir, name + '.tmTheme')]
+        return subprocess.run(['node', os.path.join(ROOT, 'vscToTm.js')] + args, cwd=ROOT,
+                              stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+
+    def test_child_overrides_reach_icls(self):
+        self.assertEqual(self.convert('child').returncode, 0)
+        icls = os.path.join(self.dir, 'child.icls')
+        subprocess.run([sys.executable, 'colorSchemeTool.py', os.path.join(self.dir, 'child.tmTheme'), icls],
+                       cwd=ROOT, stdout=subprocess.DEVNULL, check=True)
+        self.assertEqual(foreground(icls, 'TEXT'), '222222')
+        self.assertEqual(foreground(icls, 'DEFAULT_STRING'), '0000FF')
+        self.assertEqual(foreground(icls, 'DEFAULT_KEYWORD'), 'ABCDEF')
+        self.assertEqual(foreground(icls, 'DEFAULT_LINE_COMMENT'), '00FF00')
+
+    def test_bad_theme_does_not_stop_batch(self):
+        with open(os.path.join(self.dir, 'bad.json'), 'w') as f:
+            f.write('{ bad')
+        result = self.convert('bad', 'child')
+        self.assertEqual(result.returncode, 1)
+        self.assertIn(b'bad.json', result.stderr)
+        self.assertTrue(os.path.exists(os.path.join(self.dir, 'child.tmTheme')))
+
+if __name__ == '__main__':
+    unittest.main()
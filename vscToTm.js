@@ -1,6 +1,61 @@
 const json5 = require('json5')
 const plist = require('plist')
 const fs = require('fs')
+const path = require('path')
+
+// resolved themes by absolute path, shared by all themes converted in one run
+const themeCache = new Map()
+
+function loadTheme(themePath, includedFrom = []) {
+    const fullPath = path.resolve(themePath)
+    if (includedFrom.includes(fullPath)) {
+        throw new Error(`Circular include of ${fullPath}`)
+    }
+    let theme = themeCache.get(fullPath)
+    if (!theme) {
+        const vscTheme = json5.parse(fs.readFileSync(fullPath, "utf8"))
+        theme = {
+            name: vscTheme.name,
+            colors: vscTheme.colors || {},
+            tokenColors: vscTheme.tokenColors || []
+        }
+        if (vscTheme.include) {
+            const base = loadTheme(path.join(path.dirname(fullPath), vscTheme.include), [...includedFrom, fullPath])
+            theme.colors = {...base.colors, ...theme.colors}
+            theme.tokenColors = mergeTokenColors(base.tokenColors, theme.tokenColors)
+        }
+        themeCache.set(fullPath, theme)
+    }
+    return theme
+}
+
+function ruleScopes(rule) {
+    const scopes = Array.isArray(rule.scope) ? rule.scope : rule.scope.split(",")
+    return scopes.map(scope => scope.trim()).filter(scope => scope)
+}
+
+// colorSchemeTool takes the first rule matching a scope, so base rules for scopes the including
+// theme redefines are dropped rather than just put before the overriding ones.
+// Unscoped (global) settings of both themes are merged into one leading rule.
+function mergeTokenColors(baseRules, rules) {
+    const overridden = new Set(rules.filter(rule => rule.scope).flatMap(ruleScopes))
+    const globals = [...baseRules, ...rules].filter(rule => !rule.scope)
+    const merged = []
+    if (globals.length) {
+        merged.push({settings: Object.assign({}, ...globals.map(rule => rule.settings || {}))})
+    }
+    for (const rule of baseRules.filter(rule => rule.scope)) {
+        const scopes = ruleScopes(rule)
+        const kept = scopes.filter(scope => !overridden.has(scope))
+        if (kept.length === scopes.length) {
+            merged.push(rule)
+        } else if (kept.length) {
+            merged.push({...rule, scope: kept.join(",")})
+        }
+    }
+    merged.push(...rules.filter(rule => rule.scope))
+    return merged
+}
 
 function convert(vscTheme) {
     const tmTheme = {
@@ -46,5 +101,15 @@ class SettingsMapper {
     }
 }
 
-const vscTheme = json5.parse(fs.readFileSync(process.argv[2], "utf8"))
-fs.writeFileSync(process.argv[3], plist.build(convert(vscTheme)))
\ No newline at end of file
+// usage: node vscToTm.js <VS Code theme> <TextMate theme> [<VS Code theme> <TextMate theme> ...]
+// a theme that fails to convert is reported and skipped, the exit code tells whether any did
+for (let i = 2; i + 1 < process.argv.length; i += 2) {
+    try {
+        // convert() modifies the theme, cached ones must stay intact
+        const vscTheme = structuredClone(loadTheme(process.argv[i]))
+        fs.writeFileSync(process.argv[i + 1], plist.build(convert(vscTheme)))
+    } catch (e) {
+        console.error(`Cannot convert ${process.argv[i]}: ${e.message}`)
+        process.exitCode = 1
+    }
+}